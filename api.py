@@ -1,7 +1,261 @@
+import asyncio
+import cachetools
+import collections
+import copy
+import functools
+import importlib
+import httpx
 import requests
-import json
 import random
 import re
+import string
+import threading
+import unicodedata
+import weakref
+from concurrent.futures import Future
+from types import ModuleType
+from typing import Any, Callable, Concatenate, Coroutine, Dict, Generator, Iterable, Iterator, List, Optional, ParamSpec, Sequence, Set, Tuple, Type, TypeVar, Union, cast
+from urllib.parse import quote_plus, urlencode, urlsplit
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+_dumps: Callable[[Any], bytes]
+_loads: Callable[[Union[bytes, str]], Any]
+try:
+    import orjson
+    _dumps = orjson.dumps
+    _loads = orjson.loads
+except ImportError:
+    import json
+
+    def _json_dumps(obj: Any) -> bytes:
+        return json.dumps(obj).encode()
+
+    _dumps = _json_dumps
+    _loads = json.loads
+
+h2: Optional[ModuleType]
+try:
+    import h2
+except ImportError:
+    h2 = None
+
+simdjson: Optional[ModuleType]
+try:
+    import simdjson
+except ImportError:
+    simdjson = None
+
+# only checked for presence (httpx and urllib3 do the decoding), and neither
+# package ships type information, so import them by name
+brotli: Optional[ModuleType]
+try:
+    brotli = importlib.import_module('brotli')
+except ImportError:
+    try:
+        brotli = importlib.import_module('brotlicffi')
+    except ImportError:
+        brotli = None
+
+_ACCEPT_ENCODING = 'br, gzip, deflate' if brotli else 'gzip, deflate'
+
+_EMPTY: Dict[str, Any] = {}
+_SLUG_TABLE = str.maketrans(string.ascii_uppercase + ' ', string.ascii_lowercase + '-')
+# letters NFKD does not decompose into an ascii base letter
+_TRANSLIT_TABLE = str.maketrans({
+    'ø': 'o', 'Ø': 'O', 'ł': 'l', 'Ł': 'L', 'đ': 'd', 'Đ': 'D', 'ð': 'd', 'Ð': 'D',
+    'ħ': 'h', 'Ħ': 'H', 'ı': 'i', 'ŧ': 't', 'Ŧ': 'T', 'ß': 'ss', 'ẞ': 'SS',
+    'æ': 'ae', 'Æ': 'AE', 'œ': 'oe', 'Œ': 'OE', 'þ': 'th', 'Þ': 'TH',
+})
+_HOST_LABEL = re.compile(r'[a-z0-9-]+')
+_MISSING = object()
+
+_Request = collections.namedtuple('_Request', ['method', 'url', 'params', 'headers', 'body'], defaults=(None, None, None))
+
+_P = ParamSpec('_P')
+_R = TypeVar('_R')
+_F = TypeVar('_F', bound=Callable[..., Any])
+_Self = TypeVar('_Self', bound='KennisHubAPI')
+_Response = Union[requests.Response, httpx.Response]
+# an endpoint op yields the requests it needs and returns the parsed result
+_Op = Generator[_Request, _Response, _R]
+_Rule = Tuple[bool, Optional[int], Optional[str], Optional[str]]
+
+# (required, max_length, required_message, max_length_message)
+_TOPIC_RULES = (
+    (True, None, 'Titel is verplicht', None),
+    (True, 280, 'Een korte beschrijving is verplicht', 'Er zijn maximaal 280 karakters toegestaan'),
+)
+_SOURCE_RULES = (
+    (True, None, 'Een titel is verplicht.', None),
+    (True, None, 'Een bron is verplicht', None),
+)
+_SOURCE_DESCRIPTION_RULE = (False, 180, None, 'Informatie over deze bron mag maar 180 karakters zijn.')
+_MESSAGE_RULE = (True, 144, 'Een bericht is verplicht', 'Een bericht mag maximaal 144 karakters zijn')
+
+
+def _running_loop() -> Optional[asyncio.AbstractEventLoop]:
+    try:
+        return asyncio.get_running_loop()
+    except RuntimeError:
+        return None
+
+
+def _is_valid_url(url: str) -> bool:
+    if not url or any(c.isspace() for c in url):
+        return False
+    try:
+        parts = urlsplit(url if '://' in url else 'http://' + url)
+        host = parts.hostname
+        parts.port
+    except ValueError:
+        return False
+    if parts.scheme not in ('http', 'https') or not host or parts.username is not None or parts.password is not None:
+        return False
+    labels = host.split('.')
+    if len(labels) < 2 or not all(_HOST_LABEL.fullmatch(label) for label in labels):
+        return False
+    tld = labels[-1]
+    return len(tld) >= 2 and tld.isalpha()
+
+
+def _validate(values: Sequence[str], rules: Sequence[_Rule]) -> None:
+    for value, (required, max_length, required_message, max_length_message) in zip(values, rules):
+        if required and not value:
+            raise ValueError(required_message)
+        if max_length and len(value) > max_length:
+            raise ValueError(max_length_message)
+
+
+def _response_data(response: _Response) -> Iterable[Any]:
+    if simdjson:
+        payload = simdjson.Parser().parse(response.content)
+        is_object = isinstance(payload, simdjson.Object)
+    else:
+        payload = _loads(response.content)
+        is_object = isinstance(payload, dict)
+    if not is_object:
+        raise ApiError('Unexpected response')
+    data = payload.get('data')
+    return [] if data is None else data
+
+
+def _getter(row: Any) -> Callable[[str], Any]:
+    get = row.get
+    if simdjson is None or isinstance(row, dict):
+        return get
+
+    # simdjson rows hand out lazy proxies tied to their parser, copy them out
+    def plain_get(key: str) -> Any:
+        value = get(key)
+        if isinstance(value, simdjson.Object):
+            return value.as_dict()
+        if isinstance(value, simdjson.Array):
+            return value.as_list()
+        return value
+    return plain_get
+
+
+def _topic_info(topic: Any) -> Dict[str, Any]:
+    get = _getter(topic)
+    user = get('user') or _EMPTY
+    return {
+        'topic_id': get('id'),
+        'user_id': get('user_id'),
+        'title': get('title'),
+        'topic_slug': get('slug'),
+        'description': get('description'),
+        'topic_created_at': get('created_at'),
+        'topic_updated_at': get('updated_at'),
+        'topic_human_readable_created_at': get('human_readable_created_at'),
+        'user_name': user.get('name'),
+        'user_slug': user.get('slug'),
+    }
+
+
+def _post_info(post: Any) -> Dict[str, Any]:
+    get = _getter(post)
+    user = get('user') or _EMPTY
+    return {
+        'title': get('title'),
+        'description': get('description'),
+        'url': get('url'),
+        'post_id': get('id'),
+        'post_date': get('human_readable_created_at'),
+        'user_name': user.get('name'),
+        'user_slug': user.get('slug'),
+        'upvotes_count': get('upvotes_count'),
+        'comments_count': get('comments_count'),
+        'post_created_at': get('created_at'),
+        'post_updated_at': get('updated_at')
+    }
+
+
+def _singleflight(method: Callable[Concatenate[_Self, _P], _R]) -> Callable[Concatenate[_Self, _P], _R]:
+    @functools.wraps(method)
+    def wrapper(self: _Self, *args: _P.args, **kwargs: _P.kwargs) -> _R:
+        key = (method.__name__, args, tuple(sorted(kwargs.items())))
+        with self._inflight_lock:
+            future = self._inflight.get(key)
+            leader = future is None
+            if future is None:
+                future = self._inflight[key] = Future()
+        if not leader:
+            return copy.deepcopy(future.result())
+        try:
+            result = method(self, *args, **kwargs)
+        except BaseException as error:
+            future.set_exception(error)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self._inflight_lock:
+                del self._inflight[key]
+    return wrapper
+
+
+def _asingleflight(method: Callable[Concatenate[_Self, _P], Coroutine[Any, Any, _R]]) -> Callable[Concatenate[_Self, _P], Coroutine[Any, Any, _R]]:
+    @functools.wraps(method)
+    async def wrapper(self: _Self, *args: _P.args, **kwargs: _P.kwargs) -> _R:
+        key = (method.__name__, args, tuple(sorted(kwargs.items())))
+        # tasks can only be awaited from their own loop, so each loop gets its own table
+        inflight = self._ainflight.setdefault(asyncio.get_running_loop(), {})
+        task = inflight.get(key)
+        leader = task is None
+        if task is None:
+            task = asyncio.ensure_future(method(self, *args, **kwargs))
+            inflight[key] = task
+            task.add_done_callback(lambda _: inflight.pop(key, None))
+        result = await asyncio.shield(task)
+        return result if leader else copy.deepcopy(result)
+    return wrapper
+
+
+def _cached(label: str) -> Callable[[_F], _F]:
+    def decorator(method: _F) -> _F:
+        if asyncio.iscoroutinefunction(method):
+            @functools.wraps(method)
+            async def wrapper(self, *args, **kwargs):
+                key = (label, args, tuple(sorted(kwargs.items())))
+                result = self._cache_get(key)
+                if result is _MISSING:
+                    result = await method(self, *args, **kwargs)
+                    self._cache_set(key, result)
+                return result
+        else:
+            @functools.wraps(method)
+            def wrapper(self, *args, **kwargs):
+                key = (label, args, tuple(sorted(kwargs.items())))
+                result = self._cache_get(key)
+                if result is _MISSING:
+                    result = method(self, *args, **kwargs)
+                    self._cache_set(key, result)
+                return result
+        return cast(_F, wrapper)
+    return decorator
+
 
 class ApiError(Exception):
     pass
@@ -15,59 +269,279 @@ class LoginError(ApiError):
 class PasswordError(ApiError):
     pass
 
+class InvalidVerificationLink(ApiError):
+    pass
+
 
 class KennisHubAPI:
-    def __init__(self, base_url="https://admin.kennishub.nl/api/v1/", response_format="json"):
+    def __init__(self, base_url: str = "https://admin.kennishub.nl/api/v1/", response_format: str = "json", cache_ttl: float = 30) -> None:
         self.base_url = base_url
         self.format = response_format
+        self._ep = {
+            'login': base_url + 'user/login',
+            'register': base_url + 'user/register',
+            'reset': base_url + 'user/reset_password',
+            'user_details': base_url + 'user/details',
+            'topics_create': base_url + 'topics/create',
+            'topics_list': base_url + 'topics/list',
+            'forgot': base_url + 'user/forgot-password',
+            'posts_create': base_url + 'posts/create',
+            'posts_list': base_url + 'posts/list'
+        }
+        self._ep_verify = (base_url + 'email/verify/{}/{}').format
+        self._ep_follow = (base_url + 'topics/{}/follow-topic').format
+        self._ep_profile = (base_url + 'user/profile/{}').format
+        self._ep_comment = (base_url + 'comments/{}/create').format
+        self._topics_list_urls = {
+            order: f"{self._ep['topics_list']}?sortOrder={order}" for order in ('asc', 'desc')
+        }
+        self._posts_list_queries = {
+            (sort_by, order): f"sortBy={sort_by}&sortOrder={order}"
+            for sort_by in ('created_at', 'updated_at')
+            for order in ('asc', 'desc')
+        }
+        self._return_mode = response_format if response_format in ("json", "bytes") else "text"
+        self._background_tasks: Set[asyncio.Task] = set()
+        self._auth_cache: Tuple[Optional[str], Dict[str, str]] = (None, {})
+        self._inflight: Dict[tuple, Future] = {}
+        self._inflight_lock = threading.Lock()
+        self._ainflight: weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[tuple, asyncio.Future]] = weakref.WeakKeyDictionary()
+        self._cache: cachetools.TTLCache[tuple, Any] = cachetools.TTLCache(maxsize=256, ttl=cache_ttl)
+        self._cache_lock = threading.RLock()
+        self._cache_hits = 0
+        self._cache_misses = 0
+        self.session = requests.Session()
+        retry = Retry(
+            total=3,
+            connect=3,
+            read=2,
+            backoff_factor=0.5,
+            status_forcelist=(429, 500, 502, 503, 504),
+            allowed_methods=frozenset(['GET']),
+            respect_retry_after_header=True,
+            raise_on_status=False
+        )
+        adapter = HTTPAdapter(pool_connections=10, pool_maxsize=50, max_retries=retry)
+        self.session.mount("https://", adapter)
+        self._headers = {
+            'Content-Type': 'application/json',
+            'Accept': 'application/json',
+            'Accept-Encoding': _ACCEPT_ENCODING
+        }
+        self.session.headers.update(self._headers)
+        self._aclient: Optional[httpx.AsyncClient] = None
+        self._aclient_loop: Optional[asyncio.AbstractEventLoop] = None
+
+    @property
+    def aclient(self) -> httpx.AsyncClient:
+        loop = _running_loop()
+        aclient = self._aclient
+        if aclient is None or self._aclient_loop is not loop:
+            # pooled connections cannot be reused from another event loop
+            aclient = self._aclient = self._new_aclient()
+            self._aclient_loop = loop
+        return aclient
+
+    def _new_aclient(self) -> httpx.AsyncClient:
+        transport = httpx.AsyncHTTPTransport(
+            http2=h2 is not None,
+            limits=httpx.Limits(max_keepalive_connections=20, max_connections=100),
+            retries=3
+        )
+        return httpx.AsyncClient(
+            base_url=self.base_url,
+            transport=transport,
+            timeout=10.0,
+            headers=self._headers
+        )
+
+    def set_token(self, token: str) -> None:
+        authorization = f"Bearer {token}"
+        self._headers['Authorization'] = authorization
+        self.session.headers['Authorization'] = authorization
+        if self._aclient is not None:
+            self._aclient.headers['Authorization'] = authorization
+        self.invalidate()
+
+    def invalidate(self, prefix: str = '') -> None:
+        with self._cache_lock:
+            for key in [key for key in self._cache if key[0].startswith(prefix)]:
+                # an entry can expire between listing the keys and deleting it
+                self._cache.pop(key, None)
+
+    def cache_info(self) -> dict:
+        with self._cache_lock:
+            return {
+                'hits': self._cache_hits,
+                'misses': self._cache_misses,
+                'size': len(self._cache),
+                'maxsize': self._cache.maxsize,
+                'ttl': self._cache.ttl
+            }
+
+    # the cache keeps its own copy and hands out copies, so callers can
+    # mutate what they get back without changing later results
+    def _cache_get(self, key):
+        if self._cache.ttl <= 0:
+            return _MISSING
+        with self._cache_lock:
+            result = self._cache.get(key, _MISSING)
+            if result is _MISSING:
+                self._cache_misses += 1
+                return result
+            self._cache_hits += 1
+        return copy.deepcopy(result)
+
+    def _cache_set(self, key, result):
+        if self._cache.ttl <= 0:
+            return
+        result = copy.deepcopy(result)
+        with self._cache_lock:
+            self._cache[key] = result
+
+    def close(self) -> None:
+        self.session.close()
+        aclient, self._aclient = self._aclient, None
+        if aclient is not None and self._aclient_loop is _running_loop():
+            self._spawn(aclient.aclose())
+
+    async def aclose(self) -> None:
+        self.session.close()
+        if self._background_tasks:
+            await asyncio.gather(*self._background_tasks, return_exceptions=True)
+        aclient, self._aclient = self._aclient, None
+        if aclient is not None and self._aclient_loop is _running_loop():
+            await aclient.aclose()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.aclose()
     
-    def validate_title_and_description(self, title, description):
-        if not title:
-            raise ValueError('Titel is verplicht')
-        if not description:
-            raise ValueError('Een korte beschrijving is verplicht')
-        if len(description) > 280:
-            raise ValueError('Er zijn maximaal 280 karakters toegestaan')
-
-    def validate_link_and_title(self, url, title):
-        if not title:
-            raise ValueError('Een titel is verplicht.')
-        if not url:
-            raise ValueError('Een bron is verplicht')
-        pattern = re.compile(r'^((https?):\/\/)?(www.)?[a-z0-9-]+(\.[a-z]{2,}){1,3}(#?\/?[a-zA-Z0-9#-]+)*\/?(\?[a-zA-Z0-9-_]+=[a-zA-Z0-9-%]+&?)?$')
-        if not pattern.match(url):
+    def _auth(self, token: Optional[str]) -> Optional[Dict[str, str]]:
+        if token is None:
+            return None
+        cached_token, headers = self._auth_cache
+        if token != cached_token:
+            headers = {"Authorization": f"Bearer {token}"}
+            self._auth_cache = (token, headers)
+        return headers
+
+    def _topics_list_url(self, sort_order):
+        url = self._topics_list_urls.get(sort_order)
+        if url is None:
+            url = f"{self._ep['topics_list']}?{urlencode({'sortOrder': sort_order})}"
+        return url
+
+    def _posts_list_url(self, topic_slug, sort_by, sort_order):
+        query = self._posts_list_queries.get((sort_by, sort_order))
+        if query is None:
+            query = urlencode({'sortBy': sort_by, 'sortOrder': sort_order})
+        return f"{self._ep['posts_list']}?topic_slug={quote_plus(topic_slug)}&{query}"
+
+    def _handle(self, resp: _Response, *, return_data: bool = True, error_cls: Type[Exception] = ApiError, message: Optional[str] = None) -> Any:
+        resp.raise_for_status()
+        payload = _loads(resp.content)
+        if not payload.get('status'):
+            raise error_cls(message or payload.get('message', 'Unknown'))
+        if return_data:
+            return payload['data']
+
+    def _finalize(self, resp: _Response) -> Any:
+        if self._return_mode == "json":
+            return _loads(resp.content)
+        if self._return_mode == "bytes":
+            return resp.content
+        return resp.text
+
+    def _spawn(self, request: Coroutine[Any, Any, _R]) -> 'asyncio.Task[_R]':
+        task = asyncio.create_task(request)
+        self._background_tasks.add(task)
+        task.add_done_callback(self._task_done)
+        return task
+
+    def _task_done(self, task: asyncio.Task) -> None:
+        self._background_tasks.discard(task)
+        if not task.cancelled():
+            task.exception()
+
+    def validate_title_and_description(self, title: str, description: str) -> None:
+        _validate((title, description), _TOPIC_RULES)
+
+    def validate_link_and_title(self, url: str, title: str, description: str = "") -> None:
+        _validate((title, url), _SOURCE_RULES)
+        if not _is_valid_url(url):
             raise ValueError('Vul een valide url in')
-        if len(description) > 180:
-            raise ValueError('Informatie over deze bron mag maar 180 karakters zijn.')
+        _validate((description,), (_SOURCE_DESCRIPTION_RULE,))
     
-    def validate_message(self, message):
-        if not message:
-            raise ValueError('Een bericht is verplicht')
-        if len(message) > 144:
-            raise ValueError('Een bericht mag maximaal 144 karakters zijn')
+    def validate_message(self, message: str) -> None:
+        _validate((message,), (_MESSAGE_RULE,))
     
-    def input2slug(self, input):
-        slug = input.lower().replace(' ', '-')
-        return slug
+    @staticmethod
+    @functools.lru_cache(maxsize=1024)
+    def input2slug(input: str) -> str:
+        if input.isascii():
+            return input.translate(_SLUG_TABLE)
+        decomposed = unicodedata.normalize('NFKD', input.translate(_TRANSLIT_TABLE))
+        # drop only the accents, letters from other scripts stay in the slug;
+        # NFC puts back what NFKD split apart without an accent (e.g. hangul)
+        stripped = unicodedata.normalize('NFC', ''.join(c for c in decomposed if not unicodedata.combining(c)))
+        return stripped.lower().replace(' ', '-')
+
+    def _send(self, request: _Request) -> requests.Response:
+        return self.session.request(
+            request.method,
+            request.url,
+            params=request.params,
+            headers=request.headers,
+            data=request.body
+        )
 
-    def login_user(self, email, password):
-        endpoint = f"{self.base_url}user/login"
+    async def _asend(self, request: _Request) -> httpx.Response:
+        return await self.aclient.request(
+            request.method,
+            request.url,
+            params=request.params,
+            headers=request.headers,
+            content=request.body
+        )
+
+    def _run(self, op: _Op[_R]) -> _R:
+        request = next(op)
+        while True:
+            try:
+                request = op.send(self._send(request))
+            except StopIteration as stop:
+                return stop.value
+
+    def _arun(self, op: _Op[_R]) -> Coroutine[Any, Any, _R]:
+        # advance to the first request now so validation errors raise before any await
+        return self._adrive(op, next(op))
+
+    async def _adrive(self, op: _Op[_R], request: _Request) -> _R:
+        while True:
+            response = await self._asend(request)
+            try:
+                request = op.send(response)
+            except StopIteration as stop:
+                return stop.value
+
+    def _login_user_op(self, email, password):
         data = {
             "email": email,
             "password": password
         }
-        headers = {'Content-type': 'application/json', 'Accept': 'text/plain'}
-        response = requests.post(endpoint, data=json.dumps(data), headers=headers)
+        response = yield _Request('POST', self._ep['login'], body=_dumps(data))
+        self._handle(response, return_data=False, error_cls=LoginError, message="Onjuiste gebruikersnaam of wachtwoord")
 
-        if response.status_code == 200:
-            data = response.json()
-            if not data.get("status"):
-                raise LoginError("Onjuiste gebruikersnaam of wachtwoord")
-        else:
-            response.raise_for_status()
-        
-    def register_user(self, name, email, function, password, url=""):
-        endpoint = f"{self.base_url}user/register"
+    def _register_user_op(self, name, email, function, password, url):
         data = {
             "name": name,
             "email": email,
@@ -77,211 +551,242 @@ class KennisHubAPI:
         }
         if len(password) < 8:
             raise RegistrationError("Je wachtwoord moet minimaal 8 karakters bevatten.")
-        headers = {'Content-type': 'application/json', 'Accept': 'text/plain'}
-        response = requests.post(endpoint, data=json.dumps(data), headers=headers)
-
-        if response.status_code == 200:
-            data = response.json()
-            if not data.get("status"):
-                raise RegistrationError("Er is iets mis gegaan met registreren, probeer het later nog eens. Of probeer je wachtwoord te resetten.")
-        elif response.status_code == 401:
+        response = yield _Request('POST', self._ep['register'], body=_dumps(data))
+        if response.status_code == 401:
             raise RegistrationError("Wachtwoord is verplicht.")
-        else:
-            response.raise_for_status()
+        self._handle(response, return_data=False, error_cls=RegistrationError, message="Er is iets mis gegaan met registreren, probeer het later nog eens. Of probeer je wachtwoord te resetten.")
 
-    def reset_password(self, email):
-        endpoint = f"{self.base_url}user/reset_password"
+    def _reset_password_op(self, email):
         data = {
             "email": email
         }
-        headers = {'Content-type': 'application/json', 'Accept': 'text/plain'}
-        response = requests.post(endpoint, data=json.dumps(data), headers=headers)
-
-        if response.status_code == 200:
-            data = response.json()
-            if not data.get("status"):
-                error_message = data.get("message")
-                if error_message and "The selected E-mailadres is invalid." in error_message:
-                    raise PasswordError("Invalid email address")
-                else:
-                    raise PasswordError("Unknown error")
-        else:
-            response.raise_for_status()
-
+        response = yield _Request('POST', self._ep['reset'], body=_dumps(data))
+        try:
+            self._handle(response, return_data=False, error_cls=PasswordError)
+        except PasswordError as error:
+            if "The selected E-mailadres is invalid." in str(error):
+                raise PasswordError("Invalid email address") from None
+            raise PasswordError("Unknown error") from None
 
-    def verify_email(self, id, hash_value, expires, signature):
-        endpoint = f"{self.base_url}email/verify/{id}/{hash_value}"
+    def _verify_email_op(self, id, hash_value, expires, signature):
         params = {
             "expires": expires,
             "signature": signature
         }
-        headers = {'Content-type': 'application/json', 'Accept': 'text/plain'}
-        response = requests.get(endpoint, params=params, headers=headers)
-
+        response = yield _Request('GET', self._ep_verify(id, hash_value), params=params)
         if response.status_code != 200:
             raise InvalidVerificationLink("Invalid verification link")
-
-        data = response.json()
-        return data
+        return _loads(response.content)
     '''
     Verify email will look something like this
     https://admin.kennishub.nl/api/v1/email/verify/92/b0392efa4c2c2e3e0dd017df3254d9ffaf438af3?expires=1677581044&signature=72451f4e4e23c2337086c812ecd41927da5a5b4d743ca2b5b25013e04244ec17
     '''
-    
-    def get_user_info(self, token: str) -> dict:
-        endpoint = f"{self.base_url}user/details"
-        headers = {
-            "Authorization": f"Bearer {token}",
-            "Content-Type": "application/json"
-        }
-        response = requests.get(endpoint, headers=headers)
-
-        if response.status_code == 200:
-            data = response.json()
-            if data.get("status") == True:
-                return data["data"]
-            else:
-                raise ValueError(data["message"])
-        else:
-            response.raise_for_status()
 
-    def create_topic(self, token, title, description):
+    def _get_user_info_op(self, token):
+        response = yield _Request('GET', self._ep['user_details'], headers=self._auth(token))
+        return self._handle(response, error_cls=ValueError)
+
+    def _create_topic_op(self, token, title, description):
         self.validate_title_and_description(title, description)
-        endpoint = f"{self.base_url}topics/create"
         params = {
             "title": title,
             "description": description
             }
-        headers = {"Authorization": f"Bearer {token}"}
-        response = requests.post(endpoint,headers=headers,params=params)
-        if response.status_code == 200:
-            data = response.json()
-            if data['status']:
-                return data['data']
-            else:
-                raise ValueError(data['message'])
-        else:
-            response.raise_for_status()
-
-    def follow_topic(self, token, topic_id):
-        endpoint = f"{self.base_url}topics/{topic_id}/follow-topic"
-        headers = {"Authorization": f"Bearer {token}"}
-        response = requests.post(endpoint,headers=headers)
-        if self.format == "json":
-            return response.json()
-        else:
-            return response.text
+        response = yield _Request('POST', self._ep['topics_create'], params=params, headers=self._auth(token))
+        topic = self._handle(response, error_cls=ValueError)
+        self.invalidate('topics_list')
+        return topic
 
-    def get_topics_list(self, token, sort_order='desc'):
-        endpoint = f"{self.base_url}topics/list"
-        params = {"sortOrder": sort_order}
-        headers = {"Authorization": f"Bearer {token}"}
-        response = requests.get(endpoint,headers=headers,params=params)
+    def _follow_topic_op(self, token, topic_id):
+        response = yield _Request('POST', self._ep_follow(topic_id), headers=self._auth(token))
+        return self._finalize(response)
+
+    def _topics_list_op(self, token, sort_order):
+        response = yield _Request('GET', self._topics_list_url(sort_order), headers=self._auth(token))
         response.raise_for_status()
-        data = response.json().get('data', [])
-
-        selected_info = []
-        for topic in data:
-            topics_info = {
-                'topic_id': topic.get('id'),
-                'user_id': topic.get('user_id'),
-                'title': topic.get('title'),
-                'topic_slug': topic.get('slug'),
-                'description': topic.get('description'),
-                'topic_created_at': topic.get('created_at'),
-                'topic_updated_at': topic.get('updated_at'),
-                'topic_human_readable_created_at': topic.get('human_readable_created_at'),
-                'user_name': topic.get('user', {}).get('name'),
-                'user_slug': topic.get('user', {}).get('slug'),
-            }
-            selected_info.append(topics_info)
-        
-        return selected_info
+        data = _response_data(response)
 
-    def get_profile(self, token, input_name):
+        return (_topic_info(topic) for topic in data)
+
+    def _profile_op(self, token, input_name):
         slug = self.input2slug(input_name)
-        endpoint = f"{self.base_url}user/profile/{slug}"
-        headers = {"Authorization": f"Bearer {token}"}
-        response = requests.get(endpoint, headers=headers)
-        if response.status_code == 200:
-            data = response.json()
-            if data['status']:
-                return data['data']
-            else:
-                raise ValueError(data['message'])
-        else:
-            response.raise_for_status()
-    
+        response = yield _Request('GET', self._ep_profile(slug), headers=self._auth(token))
+        return self._handle(response, error_cls=ValueError)
 
-    def forgot_password(self, email):
-        endpoint = f"{self.base_url}user/forgot-password"
-        headers = {'Content-type': 'application/json', 'Accept': 'text/plain'}
+    def _forgot_password_op(self, email):
         data = {
             "email": email
         }
-        response = requests.post(endpoint, data=json.dumps(data), headers=headers)
-
-        if self.format == "json":
-            return response.json()
-        else:
-            return response.text
+        response = yield _Request('POST', self._ep['forgot'], body=_dumps(data))
+        return self._finalize(response)
 
-    def send_posts_replies(self, token, title, description, topic_id, url=""):
-        self.validate_link_and_title(url, title)
-        endpoint = f"{self.base_url}posts/create"
+    def _send_posts_replies_op(self, token, title, description, topic_id, url):
+        self.validate_link_and_title(url, title, description)
         params = {
             "title": title,
             "description": description,
             "topic_id": topic_id,
             "url": url
         }
-        headers = {"Authorization": f"Bearer {token}"}
-        response = requests.post(endpoint, params=params, headers=headers)
-        if self.format == "json":
-            return response.json()
-        else:
-            return response.text
+        response = yield _Request('POST', self._ep['posts_create'], params=params, headers=self._auth(token))
+        return self._finalize(response)
 
-    def send_reply_comment(self, token, message, post_id):
-        endpoint = f"{self.base_url}comments/{post_id}/create"
+    def _send_reply_comment_op(self, token, message, post_id):
         params = {
             "message": message
         }
-        headers = {"Authorization": f"Bearer {token}"}
-        response = requests.post(endpoint, params=params, headers=headers)
-        if self.format == "json":
-            return response.json()
-        else:
-            return response.text
+        response = yield _Request('POST', self._ep_comment(post_id), params=params, headers=self._auth(token))
+        return self._finalize(response)
 
-    def get_topics_replies(self, token, input_topic, sort_by='created_at', sort_order='desc'):
+    def _topics_replies_op(self, token, input_topic, sort_by, sort_order):
         topic_slug = self.input2slug(input_topic)
-        url = f"{self.base_url}posts/list"
-        params = {
-            "topic_slug": topic_slug,
-            "sortBy": sort_by,
-            "sortOrder": sort_order
-            }
-        headers = {"Authorization": f"Bearer {token}"}
-        response = requests.get(url, headers=headers, params=params)
-        data = response.json().get('data', [])
-
-        selected_info = []
-        for post in data:
-            post_info = {
-                'title': post.get('title'),
-                'description': post.get('description'),
-                'url': post.get('url'),
-                'post_id': post.get('id'),
-                'post_date': post.get('human_readable_created_at'),
-                'user_name': post.get('user', {}).get('name'),
-                'user_slug': post.get('user', {}).get('slug'),
-                'upvotes_count': post.get('upvotes_count'),
-                'comments_count': post.get('comments_count'),
-                'post_created_at': post.get('user', {}).get('created_at'),
-                'post_updated_at': post.get('user', {}).get('updated_at')
-            }
-            selected_info.append(post_info)
-        
-        return selected_info
+        url = self._posts_list_url(topic_slug, sort_by, sort_order)
+        response = yield _Request('GET', url, headers=self._auth(token))
+        response.raise_for_status()
+        data = _response_data(response)
+
+        return (_post_info(post) for post in data)
+
+    def login_user(self, email: str, password: str) -> None:
+        self._run(self._login_user_op(email, password))
+
+    def register_user(self, name: str, email: str, function: str, password: str, url: str = "") -> None:
+        self._run(self._register_user_op(name, email, function, password, url))
+
+    def reset_password(self, email: str) -> None:
+        self._run(self._reset_password_op(email))
+
+    def verify_email(self, id: int, hash_value: str, expires: int, signature: str) -> dict:
+        return self._run(self._verify_email_op(id, hash_value, expires, signature))
+
+    @_singleflight
+    def get_user_info(self, token: Optional[str]) -> dict:
+        return self._run(self._get_user_info_op(token))
+
+    def create_topic(self, token: Optional[str], title: str, description: str) -> Any:
+        return self._run(self._create_topic_op(token, title, description))
+
+    def follow_topic(self, token: Optional[str], topic_id: int) -> Any:
+        return self._run(self._follow_topic_op(token, topic_id))
+
+    @_cached('topics_list')
+    @_singleflight
+    def get_topics_list(self, token: Optional[str], sort_order: str = 'desc') -> List[dict]:
+        return list(self.iter_topics_list(token, sort_order))
+
+    def iter_topics_list(self, token: Optional[str], sort_order: str = 'desc') -> Iterator[dict]:
+        return self._run(self._topics_list_op(token, sort_order))
+
+    @_cached('profile')
+    @_singleflight
+    def get_profile(self, token: Optional[str], input_name: str) -> Any:
+        return self._run(self._profile_op(token, input_name))
+
+    def forgot_password(self, email: str) -> Any:
+        return self._run(self._forgot_password_op(email))
+
+    def send_posts_replies(self, token: Optional[str], title: str, description: str, topic_id: int, url: str = "") -> Any:
+        return self._run(self._send_posts_replies_op(token, title, description, topic_id, url))
+
+    def send_reply_comment(self, token: Optional[str], message: str, post_id: int) -> Any:
+        return self._run(self._send_reply_comment_op(token, message, post_id))
+
+    @_singleflight
+    def get_topics_replies(self, token: Optional[str], input_topic: str, sort_by: str = 'created_at', sort_order: str = 'desc') -> List[dict]:
+        return list(self.iter_topics_replies(token, input_topic, sort_by, sort_order))
+
+    def iter_topics_replies(self, token: Optional[str], input_topic: str, sort_by: str = 'created_at', sort_order: str = 'desc') -> Iterator[dict]:
+        return self._run(self._topics_replies_op(token, input_topic, sort_by, sort_order))
+
+    async def alogin_user(self, email: str, password: str) -> None:
+        await self._arun(self._login_user_op(email, password))
+
+    async def aregister_user(self, name: str, email: str, function: str, password: str, url: str = "") -> None:
+        await self._arun(self._register_user_op(name, email, function, password, url))
+
+    async def areset_password(self, email: str) -> None:
+        await self._arun(self._reset_password_op(email))
+
+    async def averify_email(self, id: int, hash_value: str, expires: int, signature: str) -> dict:
+        return await self._arun(self._verify_email_op(id, hash_value, expires, signature))
+
+    @_asingleflight
+    async def aget_user_info(self, token: Optional[str]) -> dict:
+        return await self._arun(self._get_user_info_op(token))
+
+    async def acreate_topic(self, token: Optional[str], title: str, description: str) -> Any:
+        return await self._arun(self._create_topic_op(token, title, description))
+
+    async def afollow_topic(self, token: Optional[str], topic_id: int, fire_and_forget: bool = False) -> Any:
+        request = self._arun(self._follow_topic_op(token, topic_id))
+        if fire_and_forget:
+            return self._spawn(request)
+        return await request
+
+    @_cached('topics_list')
+    @_asingleflight
+    async def aget_topics_list(self, token: Optional[str], sort_order: str = 'desc') -> List[dict]:
+        return list(await self._arun(self._topics_list_op(token, sort_order)))
+
+    @_cached('profile')
+    @_asingleflight
+    async def aget_profile(self, token: Optional[str], input_name: str) -> Any:
+        return await self._arun(self._profile_op(token, input_name))
+
+    async def aforgot_password(self, email: str, fire_and_forget: bool = False) -> Any:
+        request = self._arun(self._forgot_password_op(email))
+        if fire_and_forget:
+            return self._spawn(request)
+        return await request
+
+    async def asend_posts_replies(self, token: Optional[str], title: str, description: str, topic_id: int, url: str = "", fire_and_forget: bool = False) -> Any:
+        request = self._arun(self._send_posts_replies_op(token, title, description, topic_id, url))
+        if fire_and_forget:
+            return self._spawn(request)
+        return await request
+
+    async def asend_reply_comment(self, token: Optional[str], message: str, post_id: int, fire_and_forget: bool = False) -> Any:
+        request = self._arun(self._send_reply_comment_op(token, message, post_id))
+        if fire_and_forget:
+            return self._spawn(request)
+        return await request
+
+    @_asingleflight
+    async def aget_topics_replies(self, token: Optional[str], input_topic: str, sort_by: str = 'created_at', sort_order: str = 'desc') -> List[dict]:
+        return list(await self._arun(self._topics_replies_op(token, input_topic, sort_by, sort_order)))
+
+    async def gather_topic_page(self, token: Optional[str], input_topic: str, input_name: str, sort_order: str = 'desc') -> dict:
+        profile, replies, topics = await asyncio.gather(
+            self.aget_profile(token, input_name),
+            self.aget_topics_replies(token, input_topic, sort_order=sort_order),
+            self.aget_topics_list(token, sort_order)
+        )
+        return {
+            'profile': profile,
+            'replies': replies,
+            'topics': topics
+        }
+
+    async def aget_topics_with_replies(self, token: Optional[str], sort_order: str = 'desc', max_concurrency: int = 10) -> List[dict]:
+        topics = await self.aget_topics_list(token, sort_order)
+        semaphore = asyncio.Semaphore(max_concurrency)
+
+        async def fetch_replies(topic):
+            async with semaphore:
+                return await self.aget_topics_replies(token, topic['topic_slug'], sort_order=sort_order)
+
+        replies = await asyncio.gather(*[fetch_replies(topic) for topic in topics], return_exceptions=True)
+        return [dict(topic, replies=topic_replies) for topic, topic_replies in zip(topics, replies)]
+
+    def get_topics_with_replies(self, token: Optional[str], sort_order: str = 'desc', max_concurrency: int = 10) -> List[dict]:
+        async def run():
+            # pooled connections belong to the loop asyncio.run is about to close
+            aclient = self.aclient
+            try:
+                return await self.aget_topics_with_replies(token, sort_order, max_concurrency)
+            finally:
+                if self._aclient is aclient:
+                    self._aclient = None
+                await aclient.aclose()
 
+        return asyncio.run(run())
@@ -0,0 +1,358 @@
+import asyncio
+import json
+import threading
+
+import pytest
+
+import api
+
+
+TOPIC = {'id': 1, 'title': 'Python', 'slug': 'python', 'user': {'name': 'Jan'}}
+
+
+class FakeResponse:
+    def __init__(self, payload, status_code=200):
+        self.status_code = status_code
+        self.content = json.dumps(payload).encode()
+        self.text = self.content.decode()
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise api.requests.HTTPError(self.status_code)
+
+
+@pytest.fixture
+def client():
+    client = api.KennisHubAPI('https://example.com/api/v1/')
+    client.sent = []
+
+    def send(request):
+        client.sent.append(request)
+        return FakeResponse({'status': True, 'data': [dict(TOPIC)]})
+
+    client._send = send
+    yield client
+    client.close()
+
+
+@pytest.mark.parametrize('url, valid', [
+    ('example.com', True),
+    ('https://example.com', True),
+    ('http://sub.example.co.uk/path?q=1#frag', True),
+    ('http://example.com:8080/', True),
+    ('https://my-site.nl', True),
+    ('', False),
+    ('example', False),
+    ('ftp://example.com', False),
+    ('http://example.c', False),
+    ('http://example.123', False),
+    ('http://exa mple.com', False),
+    ('http://example.com\n', False),
+    ('mailto:foo@bar.com', False),
+    ('user:pw@evil.com', False),
+    ('http://user@example.com', False),
+    ('http://.com', False),
+    ('http://a..com', False),
+    ('http://a.com.', False),
+    ('<script>.com', False),
+    ('http://exa_mple.com', False),
+    ('http://a.com:abc', False),
+    ('http://a.com:99999', False),
+    ('http://[::1]/', False),
+])
+def test_is_valid_url(url, valid):
+    assert api._is_valid_url(url) is valid
+
+
+@pytest.mark.parametrize('name, slug', [
+    ('Python Tips', 'python-tips'),
+    ('Café Crème', 'cafe-creme'),
+    ('Jørgen Ødegård', 'jorgen-odegard'),
+    ('Łukasz', 'lukasz'),
+    ('Straße', 'strasse'),
+    ('Æsir Þing', 'aesir-thing'),
+    ('日本', '日本'),
+    ('日本 語', '日本-語'),
+    ('Привет', 'привет'),
+    ('한국어', '한국어'),
+    ('Jan 日本', 'jan-日本'),
+    ('Ελληνικά Jan', 'ελληνικα-jan'),
+    ('Zoë Привет', 'zoe-привет'),
+    ('İstanbul', 'istanbul'),
+])
+def test_input2slug(name, slug):
+    assert api.KennisHubAPI.input2slug(name) == slug
+
+
+def test_cached_results_are_copies(client):
+    first = client.get_topics_list(None)
+    first[0]['title'] = 'changed'
+    first.append({})
+    second = client.get_topics_list(None)
+    assert second == [api._topic_info(TOPIC)]
+    second[0]['title'] = 'changed again'
+    assert client.get_topics_list(None)[0]['title'] == 'Python'
+    assert len(client.sent) == 1
+    assert client.cache_info()['hits'] == 2
+
+
+def test_create_topic_invalidates_topics_list(client):
+    client.get_topics_list(None)
+    client.create_topic(None, 'Rust', 'Een topic over Rust')
+    client.get_topics_list(None)
+    assert [request.method for request in client.sent] == ['GET', 'POST', 'GET']
+
+
+def test_set_token_invalidates_cache(client):
+    client.get_topics_list(None)
+    client.get_profile(None, 'Jan')
+    client.set_token('secret')
+    assert client.cache_info()['size'] == 0
+    client.get_topics_list(None)
+    assert len(client.sent) == 3
+
+
+def test_invalidate_tolerates_entries_expiring(client, monkeypatch):
+    now = [0.0]
+    client._cache = api.cachetools.TTLCache(maxsize=256, ttl=30, timer=lambda: now[0])
+    list_keys = api.cachetools.TTLCache.__iter__
+
+    def list_keys_then_expire(cache):
+        yield from list_keys(cache)
+        now[0] += 31
+
+    monkeypatch.setattr(api.cachetools.TTLCache, '__iter__', list_keys_then_expire)
+    client.get_topics_list(None)
+    client.create_topic(None, 'Rust', 'Een topic over Rust')
+    client.get_topics_list(None)
+    client.set_token('secret')
+    assert client.cache_info()['size'] == 0
+
+
+def test_cache_ttl_zero_disables_cache():
+    sent = []
+    with api.KennisHubAPI('https://example.com/api/v1/', cache_ttl=0) as client:
+        client._send = lambda request: sent.append(request) or FakeResponse({'status': True, 'data': [dict(TOPIC)]})
+        client.get_topics_list(None)
+        client.get_topics_list(None)
+        assert len(sent) == 2
+        assert client.cache_info()['size'] == 0
+
+
+USER = {'status': True, 'data': {'id': 7, 'name': 'Jan'}}
+
+
+@pytest.fixture
+def followers(monkeypatch):
+    # only followers call Future.result, so each release means one thread joined the leader
+    waiting = threading.Semaphore(0)
+
+    class WatchedFuture(api.Future):
+        def result(self, timeout=None):
+            waiting.release()
+            return super().result(timeout)
+
+    monkeypatch.setattr(api, 'Future', WatchedFuture)
+    return lambda n: all(waiting.acquire(timeout=5) for _ in range(n))
+
+
+def test_threads_share_one_request(client, followers):
+    started, release = threading.Event(), threading.Event()
+
+    def send(request):
+        client.sent.append(request)
+        started.set()
+        release.wait(5)
+        return FakeResponse(USER)
+
+    client._send = send
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(client.get_user_info('t'))) for _ in range(3)]
+    threads[0].start()
+    assert started.wait(5)
+    for thread in threads[1:]:
+        thread.start()
+    assert followers(2)
+    release.set()
+    for thread in threads:
+        thread.join(5)
+    assert len(client.sent) == 1
+    assert results == [USER['data']] * 3
+    assert results[0] is not results[1] is not results[2]
+
+
+def test_threads_all_get_the_exception(client, followers):
+    started, release = threading.Event(), threading.Event()
+
+    def send(request):
+        client.sent.append(request)
+        started.set()
+        release.wait(5)
+        return FakeResponse({}, status_code=500)
+
+    def call():
+        try:
+            client.get_user_info('t')
+        except api.requests.HTTPError as error:
+            errors.append(error)
+
+    client._send = send
+    errors = []
+    threads = [threading.Thread(target=call) for _ in range(3)]
+    threads[0].start()
+    assert started.wait(5)
+    for thread in threads[1:]:
+        thread.start()
+    assert followers(2)
+    release.set()
+    for thread in threads:
+        thread.join(5)
+    assert len(client.sent) == 1
+    assert len(errors) == 3
+    assert not client._inflight
+
+
+def _async_sender(client, response):
+    release = asyncio.Event()
+
+    async def asend(request):
+        client.sent.append(request)
+        await release.wait()
+        return response
+
+    client._asend = asend
+    return release
+
+
+def test_tasks_share_one_request(client):
+    async def main():
+        release = _async_sender(client, FakeResponse(USER))
+        tasks = [asyncio.create_task(client.aget_user_info('t')) for _ in range(3)]
+        await asyncio.sleep(0)
+        release.set()
+        return await asyncio.gather(*tasks)
+
+    results = asyncio.run(main())
+    assert len(client.sent) == 1
+    assert results == [USER['data']] * 3
+    assert results[0] is not results[1]
+
+
+def test_tasks_all_get_the_exception(client):
+    async def main():
+        release = _async_sender(client, FakeResponse({}, status_code=500))
+        tasks = [asyncio.create_task(client.aget_user_info('t')) for _ in range(3)]
+        await asyncio.sleep(0)
+        release.set()
+        return await asyncio.gather(*tasks, return_exceptions=True)
+
+    results = asyncio.run(main())
+    assert len(client.sent) == 1
+    assert all(isinstance(result, api.requests.HTTPError) for result in results)
+    assert not any(client._ainflight.values())
+
+
+def test_cancelled_waiter_keeps_shared_request(client):
+    async def main():
+        release = _async_sender(client, FakeResponse(USER))
+        first = asyncio.create_task(client.aget_user_info('t'))
+        second = asyncio.create_task(client.aget_user_info('t'))
+        await asyncio.sleep(0)
+        first.cancel()
+        await asyncio.sleep(0)
+        release.set()
+        return first, await second
+
+    first, result = asyncio.run(main())
+    assert first.cancelled()
+    assert result == USER['data']
+    assert len(client.sent) == 1
+
+
+@pytest.fixture(params=['json', 'simdjson'])
+def parser(request, monkeypatch):
+    if request.param == 'simdjson':
+        monkeypatch.setattr(api, 'simdjson', pytest.importorskip('simdjson'))
+    else:
+        monkeypatch.setattr(api, 'simdjson', None)
+    return request.param
+
+
+def test_response_rows_are_plain_python(client, parser):
+    topic = dict(TOPIC, description={'nl': 'Over Python'}, user={'name': 'Jan', 'slug': ['jan']})
+    client._send = lambda request: FakeResponse({'status': True, 'data': [topic]})
+    rows = client.get_topics_list(None)
+    assert rows == client.get_topics_list(None)
+    assert type(rows[0]['description']) is dict
+    assert rows[0]['description'] == {'nl': 'Over Python'}
+    assert rows[0]['user_slug'] == ['jan']
+
+
+@pytest.mark.parametrize('payload, rows', [
+    ({'status': True, 'data': None}, []),
+    ({'status': True}, []),
+])
+def test_response_without_data(client, parser, payload, rows):
+    client._send = lambda request: FakeResponse(payload)
+    assert client.get_topics_list(None) == rows
+
+
+def test_response_that_is_not_an_object(client, parser):
+    client._send = lambda request: FakeResponse([TOPIC])
+    with pytest.raises(api.ApiError):
+        client.get_topics_list(None)
+
+
+def test_event_loops_in_threads_do_not_share_tasks(client):
+    barrier = threading.Barrier(2)
+
+    async def asend(request):
+        client.sent.append(request)
+        await asyncio.sleep(0.05)
+        return FakeResponse(USER)
+
+    async def call():
+        barrier.wait(5)
+        return await client.aget_user_info('t')
+
+    client._asend = asend
+    results, errors = [], []
+
+    def run():
+        try:
+            results.append(asyncio.run(call()))
+        except Exception as error:
+            errors.append(error)
+
+    threads = [threading.Thread(target=run) for _ in range(2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(5)
+    assert errors == []
+    assert results == [USER['data']] * 2
+    assert len(client.sent) == 2
+
+
+def test_topics_with_replies_keeps_reply_errors(client):
+    topics = [dict(TOPIC, id=1, slug='python'), dict(TOPIC, id=2, slug='rust')]
+    other = api.httpx.AsyncClient()
+    created = []
+
+    async def asend(request):
+        created.append(client._aclient)
+        # another thread's loop swaps in its own client while this run is busy
+        client._aclient = other
+        if 'topic_slug=rust' in request.url:
+            return FakeResponse({}, status_code=500)
+        if 'topic_slug=' in request.url:
+            return FakeResponse({'status': True, 'data': []})
+        return FakeResponse({'status': True, 'data': topics})
+
+    client._asend = asend
+    rows = client.get_topics_with_replies(None)
+    assert rows[0]['replies'] == []
+    assert isinstance(rows[1]['replies'], api.requests.HTTPError)
+    assert created[0].is_closed
+    assert not other.is_closed
+    assert client._aclient is other